@@ -5,6 +5,7 @@ from datetime import datetime
 from itertools import groupby
 from icalendar import vRecur
 import utils
+import shards
 import settings
 from jorte_api import JorteApi
 
@@ -18,6 +19,11 @@ logger = logging.getLogger(__name__)
 
 logger.info('Starting app')
 
+shard_years = getattr(settings, 'EXPORT_SHARD_YEARS', None)
+combine = getattr(settings, 'EXPORT_COMBINE_SHARDS', False)
+if shard_years is not None:
+    shards.validate_period_years(shard_years)
+
 # Check if user can authenticate with JorteApi
 api = JorteApi(
     username=settings.USERNAME,
@@ -140,6 +146,19 @@ for id, cal in calendars.items():
     logger.info(f"Exporting calendar with id {id}")
     # print(cal.to_ical().decode("utf-8"))
 
+    if shard_years is not None:
+        manifest = shards.export_sharded_calendar(id=id,
+                                                  cal=cal,
+                                                  period_years=shard_years)
+        if combine and manifest['shards']:
+            shards.combine_shards(id=id)
+        elif combine:
+            # calendar without events, overwrite any previous combined file
+            f = open(os.path.join(f'{id}.ics'), 'wb')
+            f.write(cal.to_ical())
+            f.close()
+        continue
+
     f_name = f'{id}.ics'
     f = open(os.path.join(f_name), 'wb')
     f.write(cal.to_ical())
@@ -0,0 +1,249 @@
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from icalendar import Calendar
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+CALENDAR_END = b'END:VCALENDAR\r\n'
+
+
+def shard_dir_for_calendar(id: str, output_dir: str = '.') -> str:
+    '''
+    Returns the directory the shards and the manifest of a calendar are
+    written to.
+    '''
+    return os.path.join(output_dir, f'{id}.shards')
+
+
+def validate_period_years(period_years: int):
+    '''
+    Raises a ValueError if period_years is not a positive integer.
+    '''
+    is_int = (isinstance(period_years, int)
+              and not isinstance(period_years, bool))
+    if not is_int or period_years < 1:
+        m = f"Shard period must be a positive number of years, got " \
+            f"{period_years!r}"
+        logger.error(m)
+        raise ValueError(m)
+
+
+def period_start_year(year: int, period_years: int) -> int:
+    '''
+    Returns the first year of the period of length period_years a year
+    belongs to. Periods are aligned to multiples of period_years, e.g. with
+    period_years=5 the years 2020 to 2024 share the period starting in 2020.
+    '''
+    return year - (year % period_years)
+
+
+def period_label(start_year: int, period_years: int) -> str:
+    '''
+    Returns the label used in shard file names, e.g. '2020' or '2020-2024'.
+    '''
+    if period_years == 1:
+        return str(start_year)
+    return f'{start_year}-{start_year + period_years - 1}'
+
+
+def shard_calendar(cal: Calendar, period_years: int = 1) -> dict:
+    '''
+    Splits an icalendar calendar into one calendar per period based on the
+    start year of its events. Every shard carries the properties of the
+    original calendar. Returns a dict of period start year to
+    icalendar.Calendar, sorted by year.
+    '''
+    shards = {}
+    for component in cal.subcomponents:
+        year = component.decoded('dtstart').year
+        start_year = period_start_year(year, period_years)
+
+        if start_year not in shards:
+            shard = Calendar()
+            shard.update(cal)
+            shards[start_year] = shard
+
+        shards[start_year].add_component(component)
+
+    return dict(sorted(shards.items()))
+
+
+def load_manifest(shard_dir: str) -> dict:
+    '''
+    Loads the manifest of a shard directory. Returns an empty dict if no
+    manifest has been written yet.
+    '''
+    path = os.path.join(shard_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(shard_dir: str, manifest: dict):
+    '''
+    Writes the manifest of a shard directory. The manifest is written to a
+    temporary file first so that an interrupted export never leaves a
+    truncated manifest behind.
+    '''
+    path = os.path.join(shard_dir, MANIFEST_NAME)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path: str) -> str:
+    '''
+    Returns the sha256 hex digest of a file or None if it does not exist.
+    '''
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _render_shard(shard_dir: str, f_name: str, shard: Calendar,
+                  previous: dict) -> dict:
+    '''
+    Renders a single shard and writes it to file if its content differs from
+    the hash recorded in the previous manifest entry or from the file on
+    disk. Shards are written to a temporary file first, like the manifest.
+    Returns the manifest entry for the shard.
+    '''
+    content = shard.to_ical()
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = os.path.join(shard_dir, f_name)
+
+    unchanged = (previous.get('sha256') == sha256
+                 and file_sha256(path) == sha256)
+    if unchanged:
+        logger.debug(f"Shard {f_name} is unchanged, skipping write")
+    else:
+        logger.info(f"Writing shard {f_name}")
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    return {
+        'file': f_name,
+        'events': len(shard.subcomponents),
+        'sha256': sha256,
+        'written': not unchanged,
+    }
+
+
+def export_sharded_calendar(id: str, cal: Calendar, period_years: int = 1,
+                            output_dir: str = '.',
+                            max_workers: int = None) -> dict:
+    '''
+    Exports an icalendar calendar as one .ics file per period together with a
+    manifest containing the event count and sha256 hash of every shard.
+    Shards are rendered and written in parallel and only shards whose content
+    changed since the last export are rewritten. Shards of periods that no
+    longer contain events are removed. Returns the written manifest.
+    '''
+    validate_period_years(period_years)
+    shard_dir = shard_dir_for_calendar(id, output_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    previous_manifest = load_manifest(shard_dir)
+    previous_shards = {s['file']: s
+                       for s in previous_manifest.get('shards', [])}
+    previous_files = set(previous_shards)
+
+    # Hashes of shards for another period length can't be reused
+    if previous_manifest.get('period_years') != period_years:
+        previous_shards = {}
+
+    shards = shard_calendar(cal, period_years)
+    f_names = {start_year: f'{period_label(start_year, period_years)}.ics'
+               for start_year in shards}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            start_year: executor.submit(
+                _render_shard,
+                shard_dir,
+                f_names[start_year],
+                shard,
+                previous_shards.get(f_names[start_year], {}))
+            for start_year, shard in shards.items()
+        }
+        entries = []
+        for start_year, future in futures.items():
+            entry = future.result()
+            entry['period'] = period_label(start_year, period_years)
+            entry['start_year'] = start_year
+            entry['end_year'] = start_year + period_years - 1
+            entries.append(entry)
+
+    # Remove shards of periods without events
+    for f_name in previous_files - set(f_names.values()):
+        path = os.path.join(shard_dir, f_name)
+        if os.path.exists(path):
+            logger.info(f"Removing stale shard {f_name}")
+            os.remove(path)
+
+    written = sum(1 for e in entries if e.pop('written'))
+    logger.info(f"Wrote {written} of {len(entries)} shards for calendar {id}")
+
+    manifest = {
+        'calendar_id': id,
+        'period_years': period_years,
+        'events': sum(e['events'] for e in entries),
+        'shards': entries,
+    }
+    write_manifest(shard_dir, manifest)
+    return manifest
+
+
+def _split_shard(content: bytes) -> (bytes, bytes):
+    '''
+    Splits the content of a shard into the calendar header and the rendered
+    events. The trailing END:VCALENDAR line is dropped.
+    '''
+    end = content.rfind(CALENDAR_END)
+    if end == -1:
+        raise ValueError("Shard is missing END:VCALENDAR")
+
+    # skip the opening BEGIN:VCALENDAR and look for the first component
+    start = content.find(b'\r\nBEGIN:', len(b'BEGIN:VCALENDAR'), end)
+    start = end if start == -1 else start + 2
+    return content[:start], content[start:end]
+
+
+def combine_shards(id: str, output_dir: str = '.',
+                   f_name: str = None) -> str:
+    '''
+    Produces a single .ics file for a sharded calendar by concatenating the
+    events of all shards listed in its manifest without re-rendering them.
+    The calendar header is taken from the first shard. Returns the path of
+    the combined file.
+    '''
+    shard_dir = shard_dir_for_calendar(id, output_dir)
+    manifest = load_manifest(shard_dir)
+    if not manifest.get('shards'):
+        raise ValueError(f"No shards found for calendar {id} in {shard_dir}")
+
+    path = os.path.join(output_dir, f_name or f'{id}.ics')
+    header = None
+    with open(path, 'wb') as f:
+        for entry in manifest['shards']:
+            with open(os.path.join(shard_dir, entry['file']), 'rb') as s:
+                shard_header, events = _split_shard(s.read())
+            if header is None:
+                header = shard_header
+                f.write(header)
+            f.write(events)
+        f.write(CALENDAR_END)
+
+    logger.info(f"Combined {len(manifest['shards'])} shards into {path}")
+    return path
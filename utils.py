@@ -29,13 +29,17 @@ def calendar_from_jorte_calendar(jorte_cal: JorteCalendarDto) -> Calendar:
 def event_from_jorte_event(jorte_event: JorteEventDto,
                            is_from_sequence: bool = False) -> Event:
     '''
-    Converts a JorteEventDto to an icalendar event. A new uid is generated if
-    the event is for a sequence. Returns a single icalendar.Event.
+    Converts a JorteEventDto to an icalendar event. A uid is derived from the
+    event id, title, start and end date if the event is for a sequence, so
+    that repeated exports produce identical output. Returns a single
+    icalendar.Event.
     '''
     event = Event()
     uid = jorte_event.id
     if is_from_sequence:
-        uid = uuid.uuid4()
+        name = (f'{jorte_event.id}/{jorte_event.title}/'
+                f'{jorte_event.date_from}/{jorte_event.date_to}')
+        uid = uuid.uuid5(uuid.NAMESPACE_OID, name)
     event.add('uid', uid)
     event.add('summary', jorte_event.title)
 